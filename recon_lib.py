@@ -1,10 +1,19 @@
 from matplotlib import table
+import hashlib
+import io
+import json
+import sqlite3
 import oracledb
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import yaml
+from contextlib import closing, contextmanager
 from dataclasses import dataclass
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Union
 
 @dataclass
 class TableSpec:
@@ -12,7 +21,7 @@ class TableSpec:
     ora_table: str
     pg_schema: str
     pg_table: str
-    pk: str
+    pk: Optional[str]  # comma-separated for composite keys; None when the table has no PK
     chunks: int
 
 @dataclass
@@ -21,6 +30,9 @@ class Config:
     postgres: Dict[str, str]
     default_chunks: int
     output_dir: str
+    max_workers: int
+    fast_counts: bool
+    pg_cat_functions: bool
 
 def load_config(cfg_path: str) -> Config:
     with open(cfg_path, "r", encoding="utf-8") as f:
@@ -30,6 +42,9 @@ def load_config(cfg_path: str) -> Config:
         postgres=data["postgres"],
         default_chunks=int(data.get("default_chunks", 100)),
         output_dir=data.get("output_dir", "./recon_out"),
+        max_workers=int(data.get("max_workers", 8)),
+        fast_counts=bool(data.get("fast_counts", False)),
+        pg_cat_functions=bool(data.get("pg_cat_functions", False)),
     )
 
 def load_tables(csv_path: str, default_chunks: int) -> List[TableSpec]:
@@ -46,27 +61,101 @@ def load_tables(csv_path: str, default_chunks: int) -> List[TableSpec]:
             rows.append(TableSpec(parts[0], parts[1], parts[2], parts[3], parts[4], chunks))
     return rows
 
-def connect_oracle(cfg: Config):
+def create_oracle_pool(cfg: Config):
     dsn = oracledb.makedsn(cfg.oracle["host"], int(cfg.oracle["port"]), service_name=cfg.oracle["service_name"])
-    return oracledb.connect(user=cfg.oracle["user"], password=cfg.oracle["password"], dsn=dsn)
+    return oracledb.create_pool(
+        user=cfg.oracle["user"], password=cfg.oracle["password"], dsn=dsn,
+        min=min(2, cfg.max_workers), max=cfg.max_workers, increment=1,
+        getmode=oracledb.POOL_GETMODE_WAIT,
+    )
 
-def connect_postgres(cfg: Config):
+def create_postgres_pool(cfg: Config):
     dsn = f"host={cfg.postgres['host']} port={cfg.postgres['port']} dbname={cfg.postgres['dbname']} user={cfg.postgres['user']} password={cfg.postgres['password']}"
-    return psycopg2.connect(dsn)
+    return psycopg2.pool.ThreadedConnectionPool(min(2, cfg.max_workers), cfg.max_workers, dsn)
+
+@contextmanager
+def borrow_connections(ora_pool, pg_pool, tag: str = ""):
+    """One Oracle and one Postgres connection from the pools, always handed back."""
+    prefix = f"  {tag} " if tag else "  "
+    ora = ora_pool.acquire()
+    try:
+        pg = pg_pool.getconn()
+    except Exception:
+        ora_pool.release(ora)
+        raise
+    try:
+        yield ora, pg
+    finally:
+        # putconn rolls back any transaction left aborted by a failed query
+        try:
+            pg_pool.putconn(pg)
+        except Exception as e:
+            print(f"{prefix}[WARN] Returning Postgres connection failed: {e}")
+        try:
+            ora_pool.release(ora)
+        except Exception as e:
+            print(f"{prefix}[WARN] Returning Oracle connection failed: {e}")
+
+def pk_columns(pk: Union[str, List[str]]) -> List[str]:
+    """PK column list from either a list or a comma-separated string (composite keys)."""
+    if isinstance(pk, str):
+        return [c.strip() for c in pk.split(",") if c.strip()]
+    return list(pk)
 
 # --- Execution helpers ---
-def pg_query_df(conn, sql: str, params: Optional[tuple]=None) -> pd.DataFrame:
-    with conn.cursor() as cur:
+PG_FETCH_SIZE = 10000
+
+def pg_query_df(conn, sql: str, params: Optional[tuple]=None, stream: bool=False) -> pd.DataFrame:
+    # stream=True uses a named (server-side) cursor so libpq never buffers the
+    # whole result; rows come over PG_FETCH_SIZE at a time
+    with (conn.cursor(name="recon_stream") if stream else conn.cursor()) as cur:
+        if stream:
+            cur.itersize = PG_FETCH_SIZE
         cur.execute(sql, params or ())
+        if stream:
+            rows = []
+            while True:
+                batch = cur.fetchmany(PG_FETCH_SIZE)
+                if not batch:
+                    break
+                rows.extend(batch)
+        else:
+            # a client-side cursor already holds the whole result in libpq
+            rows = cur.fetchall()
+        # named cursors only fill description once the first fetch has run
         cols = [d[0] for d in cur.description]
-        rows = cur.fetchall()
     return pd.DataFrame(rows, columns=cols)
 
-def ora_query_df(conn, sql: str, params: Optional[dict]=None) -> pd.DataFrame:
+def pg_copy_df(conn, sql: str, params: Optional[tuple]=None, converters: Optional[dict]=None) -> pd.DataFrame:
+    """Run a SELECT through COPY ... TO STDOUT (CSV) and parse it with pandas.
+
+    Skips the per-row text-protocol fetch path; handy for compact result sets
+    that would otherwise be fetched row by row.
+    """
+    with conn.cursor() as cur:
+        # COPY takes no bind parameters, so inline them client-side
+        query = cur.mogrify(sql, params or ()).decode(psycopg2.extensions.encodings[conn.encoding])
+        query = query.strip().rstrip(";")
+        buf = io.BytesIO()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT CSV, HEADER)", buf)
+    buf.seek(0)
+    return pd.read_csv(buf, converters=converters)
+
+ORA_ARRAYSIZE = 10000
+
+def ora_query_df(conn, sql: str, params: Optional[dict]=None, arraysize: int = ORA_ARRAYSIZE) -> pd.DataFrame:
     with conn.cursor() as cur:
+        # driver defaults (arraysize=100, prefetchrows=2) cost a round-trip per ~100 rows
+        cur.arraysize = arraysize
+        cur.prefetchrows = arraysize + 1
         cur.execute(sql, params or {})
         cols = [d[0] for d in cur.description]
-        rows = cur.fetchall()
+        rows = []
+        while True:
+            batch = cur.fetchmany(cur.arraysize)
+            if not batch:
+                break
+            rows.extend(batch)
     return pd.DataFrame(rows, columns=cols)
 
 # --- Counts ---
@@ -78,121 +167,351 @@ def ora_count(conn, schema: str, table: str) -> int:
     df = ora_query_df(conn, f"SELECT COUNT(*) FROM {schema}.{table}")
     return int(df.iloc[0, 0])
 
+# UNION ALL at most this many tables per query: Oracle rejects overly long SQL
+# text, and Postgres can hit max_stack_depth on a deep set-operation tree
+COUNT_BATCH_SIZE = 50
+
+def pg_counts(conn, tables: List[Tuple[str, str]]) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """Exact row counts for many tables, one round-trip per COUNT_BATCH_SIZE tables.
+
+    Returns ({"schema.table": rows}, {"schema.table": error}). If a batch
+    fails (typically a missing table) only that batch's tables are recounted
+    one by one, so the failure is pinned on the right one.
+    """
+    counts: Dict[str, int] = {}
+    errors: Dict[str, str] = {}
+    for i in range(0, len(tables), COUNT_BATCH_SIZE):
+        batch = tables[i:i + COUNT_BATCH_SIZE]
+        sql = " UNION ALL ".join(f'SELECT %s AS name, COUNT(*) AS cnt FROM {schema}."{table}"' for schema, table in batch)
+        try:
+            df = pg_query_df(conn, sql, tuple(f"{schema}.{table}" for schema, table in batch))
+            counts.update((name, int(cnt)) for name, cnt in df.itertuples(index=False))
+            continue
+        except Exception:
+            conn.rollback()
+        for schema, table in batch:
+            try:
+                counts[f"{schema}.{table}"] = pg_count(conn, schema, table)
+            except Exception as e:
+                errors[f"{schema}.{table}"] = str(e)
+                conn.rollback()
+    return counts, errors
+
+def ora_counts(conn, tables: List[Tuple[str, str]]) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """Oracle counterpart of pg_counts, one round-trip per COUNT_BATCH_SIZE tables."""
+    counts: Dict[str, int] = {}
+    errors: Dict[str, str] = {}
+    for i in range(0, len(tables), COUNT_BATCH_SIZE):
+        batch = tables[i:i + COUNT_BATCH_SIZE]
+        sql = " UNION ALL ".join(f"SELECT :n{j} AS name, COUNT(*) AS cnt FROM {schema}.{table}" for j, (schema, table) in enumerate(batch))
+        params = {f"n{j}": f"{schema}.{table}" for j, (schema, table) in enumerate(batch)}
+        try:
+            df = ora_query_df(conn, sql, params)
+            counts.update((name, int(cnt)) for name, cnt in df.itertuples(index=False))
+            continue
+        except Exception:
+            pass
+        for schema, table in batch:
+            try:
+                counts[f"{schema}.{table}"] = ora_count(conn, schema, table)
+            except Exception as e:
+                errors[f"{schema}.{table}"] = str(e)
+    return counts, errors
+
+# --- Count estimates from optimizer statistics ---
+def pg_count_estimates(conn, schema: str) -> Dict[str, int]:
+    """Planner row estimates (pg_class.reltuples) for every table in a schema.
+
+    Tables never vacuumed/analyzed report -1 and are left out.
+    """
+    df = pg_query_df(conn, """
+        SELECT n.nspname || '.' || c.relname AS name, c.reltuples::bigint AS est
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'r' AND c.reltuples >= 0
+    """, (schema,))
+    return {name: int(est) for name, est in df.itertuples(index=False)}
+
+def ora_count_estimates(conn, schema: str) -> Dict[str, int]:
+    """ALL_TABLES.NUM_ROWS for every table in a schema (only as fresh as the last stats gather)."""
+    df = ora_query_df(conn, """
+        SELECT owner || '.' || table_name AS name, num_rows AS est
+        FROM all_tables
+        WHERE owner = :schema AND num_rows IS NOT NULL
+    """, {"schema": schema.upper()})
+    return {name: int(est) for name, est in df.itertuples(index=False)}
+
+# Relative gap between the two sides' estimates above which we count exactly
+ESTIMATE_TOLERANCE = 0.1
+
+def needs_exact_count(ora_est: Optional[int], pg_est: Optional[int], min_rows: int) -> bool:
+    """True unless both estimates exist, exceed min_rows and agree within ESTIMATE_TOLERANCE."""
+    if ora_est is None or pg_est is None:
+        return True
+    if min(ora_est, pg_est) <= min_rows:
+        return True
+    return abs(ora_est - pg_est) > ESTIMATE_TOLERANCE * max(ora_est, pg_est)
+
 def fetch_oracle_tables(conn, schema: str, default_chunks: int) -> List[TableSpec]:
     sql = """
-    SELECT t.owner, t.table_name, c.column_name AS pk
+    SELECT t.owner, t.table_name,
+           LISTAGG(cc.column_name, ',') WITHIN GROUP (ORDER BY cc.position) AS pk
     FROM all_tables t
-    JOIN all_cons_columns c ON t.owner = c.owner AND t.table_name = c.table_name
-    JOIN all_constraints k ON c.owner = k.owner AND c.table_name = k.table_name AND c.constraint_name = k.constraint_name
-    WHERE k.constraint_type = 'P' AND t.owner = :schema
+    LEFT JOIN all_constraints c
+           ON c.owner = t.owner AND c.table_name = t.table_name AND c.constraint_type = 'P'
+    LEFT JOIN all_cons_columns cc
+           ON cc.owner = c.owner AND cc.constraint_name = c.constraint_name
+    WHERE t.owner = :schema
+    GROUP BY t.owner, t.table_name
     """
-    df = ora_query_df(conn, sql, {"schema": schema.upper()})
-    tables = []
-    for _, row in df.iterrows():
-        tables.append(TableSpec(
-            ora_schema=row["OWNER"],
-            ora_table=row["TABLE_NAME"],
-            pg_schema=row["OWNER"].lower(),  # adjust mapping as needed
-            pg_table=row["TABLE_NAME"].lower(),  # adjust mapping as needed
-            pk=row["PK"],
-            chunks=default_chunks
-        ))
-    return tables
+    # a plain list of specs comes out, so skip the DataFrame round-trip
+    with conn.cursor() as cur:
+        cur.arraysize = ORA_ARRAYSIZE
+        cur.prefetchrows = ORA_ARRAYSIZE + 1
+        cur.execute(sql, {"schema": schema.upper()})
+        rows = cur.fetchall()
+    # pg schema/table mapping: adjust as needed
+    return [TableSpec(owner, table_name, owner.lower(), table_name.lower(), pk, default_chunks)
+            for owner, table_name, pk in rows]
 # --- Oracle canonical concat expression generator ---
-def ora_build_cat_expr(conn, schema: str, table: str) -> str:
-    try:
-        sql = f"""
-        SELECT LISTAGG(
-                CASE
-                WHEN data_type IN ('DATE','TIMESTAMP','TIMESTAMP WITH TIME ZONE','TIMESTAMP WITH LOCAL TIME ZONE')
-                    THEN 'NVL(TO_CHAR('||column_name||',''YYYY-MM-DD\"T\"HH24:MI:SS.FF3''),''∅'')'
-                WHEN data_type IN ('NUMBER','FLOAT')
-                    THEN 'NVL(TO_CHAR('||column_name||',''FM999999990D999999999''),''∅'')'
-                WHEN data_type LIKE '%CHAR%' OR data_type IN ('CLOB','NCLOB')
-                    THEN 'NVL(RTRIM('||column_name||'),''∅'')'
-                ELSE 'NVL(TO_CHAR('||column_name||'),''∅'')'
-                END,
-                q'[||'|'||]'
-            ) WITHIN GROUP (ORDER BY column_id) AS CAT_EXPR
+PG_NUMERIC_TYPES = ('numeric','integer','bigint','smallint','real','double precision')
+ORA_NUMERIC_TYPES = ('NUMBER','FLOAT')
+
+def ora_fetch_columns(conn, schema: str) -> Dict[str, List[Tuple[str, str]]]:
+    """Column names and data types for every table in a schema, in column_id order.
+
+    One dictionary query for the whole schema instead of one per table.
+    """
+    df = ora_query_df(conn, """
+        SELECT table_name, column_name, data_type
         FROM all_tab_columns
-        WHERE owner = '{schema.upper()}' AND table_name = '{table.upper()}'
-        """
-        df = ora_query_df(conn, sql)
-        if df.empty or not df.iloc[0,0]:
-            raise RuntimeError(f"Failed to build cat expr for {schema}.{table} (no columns?)")
-        return df.iloc[0,0]
-    except Exception as e:
-        print(f"Error building cat expr for {schema}.{table}: {e}")
-        raise
+        WHERE owner = :schema
+        ORDER BY table_name, column_id
+    """, {"schema": schema.upper()})
+    cols: Dict[str, List[Tuple[str, str]]] = {}
+    for table_name, column_name, data_type in df.itertuples(index=False):
+        cols.setdefault(table_name, []).append((column_name, data_type))
+    return cols
+
+def ora_fetch_columns_cached(conn, schema: str, cache_path: str) -> Dict[str, List[Tuple[str, str]]]:
+    """ora_fetch_columns served from a sqlite sidecar while no table DDL has changed.
+
+    ALL_OBJECTS.LAST_DDL_TIME is a far cheaper probe than ALL_TAB_COLUMNS, so the
+    full column query only reruns when a table was created or altered since the
+    cache was written.
+    """
+    owner = schema.upper()
+    df = ora_query_df(conn, """
+        SELECT object_name, TO_CHAR(last_ddl_time, 'YYYY-MM-DD HH24:MI:SS') AS ddl_time
+        FROM all_objects
+        WHERE owner = :schema AND object_type = 'TABLE'
+    """, {"schema": owner})
+    ddl_times = dict(df.itertuples(index=False))
+    with closing(sqlite3.connect(cache_path)) as db:
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS ora_columns (
+                owner TEXT, table_name TEXT, ddl_time TEXT, columns TEXT,
+                PRIMARY KEY (owner, table_name))
+        """)
+        cached = {table_name: (ddl_time, columns) for table_name, ddl_time, columns in
+                  db.execute("SELECT table_name, ddl_time, columns FROM ora_columns WHERE owner = ?", (owner,))}
+        if all(table_name in cached and cached[table_name][0] == ddl_time for table_name, ddl_time in ddl_times.items()):
+            return {table_name: [tuple(c) for c in json.loads(cached[table_name][1])] for table_name in ddl_times}
+
+        cols = ora_fetch_columns(conn, schema)
+        with db:
+            db.execute("DELETE FROM ora_columns WHERE owner = ?", (owner,))
+            db.executemany("INSERT INTO ora_columns VALUES (?, ?, ?, ?)",
+                           [(owner, table_name, ddl_times.get(table_name), json.dumps(c)) for table_name, c in cols.items()])
+        return cols
+
+# Per-column canonicalisation templates, keyed by data type
+_ORA_TEXT_TPL = "NVL(RTRIM({c}),'∅')"
+_ORA_OTHER_TPL = "NVL(TO_CHAR({c}),'∅')"
+_ORA_TPL = {
+    **dict.fromkeys(('DATE','TIMESTAMP','TIMESTAMP WITH TIME ZONE','TIMESTAMP WITH LOCAL TIME ZONE'),
+                    "NVL(TO_CHAR({c},'YYYY-MM-DD\"T\"HH24:MI:SS.FF3'),'∅')"),
+    **dict.fromkeys(ORA_NUMERIC_TYPES, "NVL(TO_CHAR({c},'FM999999990D999999999'),'∅')"),
+    **dict.fromkeys(('CLOB','NCLOB'), _ORA_TEXT_TPL),
+}
+
+def _ora_template(dtype: str) -> str:
+    tpl = _ORA_TPL.get(dtype)
+    if tpl is None:
+        tpl = _ORA_TEXT_TPL if 'CHAR' in dtype else _ORA_OTHER_TPL
+    return tpl
+
+def ora_build_cat_expr(columns: List[Tuple[str, str]], schema: str, table: str) -> str:
+    if not columns:
+        raise RuntimeError(f"Failed to build cat expr for {schema}.{table} (no columns?)")
+    return "||'|'||".join(_ora_template(dtype).format(c=name) for name, dtype in columns)
 
 # --- Postgres chunked checksum ---
-# def pg_chunk_sums(conn, schema: str, table: str, pk: str, chunks: int) -> pd.DataFrame:
-#     print(f"Generating chunked checksums for {schema}.{table}.{pk}.{chunks}.")
-#     try:
-#         sql = f"""
-#         WITH cols AS (
-#           SELECT string_agg(format('coalesce(%1$I::text,''∅'')', column_name), '||''|''||'
-#                             ORDER BY ordinal_position) AS cat
-#           FROM information_schema.columns
-#           WHERE table_schema=%s AND table_name=%s
-#         ),
-#         rows AS (
-#           SELECT ntile(%s) OVER (ORDER BY {pk.lower()}::text) AS chunk_id,
-#                  md5((SELECT cat FROM cols)) AS row_hash
-#           FROM   {schema}."{table}"
-#         )
-#         SELECT %s AS side, %s AS schema, %s AS table, chunk_id,
-#                sum(('x'||substr(row_hash,1,8))::bit(32)::int) AS chunk_sum,
-#                count(*) AS rows_in_chunk
-#         FROM rows
-#         GROUP BY chunk_id
-#         ORDER BY chunk_id;
-#         """
-#         return pg_query_df(conn, sql, (schema, table, chunks, "PG", schema, table))
-#     except Exception as e:
-#         print(f"Error in pg_chunk_sums for {schema}.{table}: {e}")
-#         raise
-
-def pg_chunk_sums(conn, schema, table, pk, chunks):
-    # build concatenation list from information_schema
-    cols_df = pg_query_df(conn, """
-        SELECT column_name, data_type
+def pg_fetch_columns(conn, schema: str) -> Dict[str, List[Tuple[str, str]]]:
+    """Postgres counterpart of ora_fetch_columns, from information_schema.columns."""
+    df = pg_query_df(conn, """
+        SELECT table_name, column_name, data_type
         FROM information_schema.columns
-        WHERE table_schema=%s AND table_name=%s
-        ORDER BY ordinal_position
-    """, (schema, table))
-    parts = []
-    for name, dtype in cols_df.to_records(index=False):
-        col = f'"{name}"'
-        if dtype in ('numeric','integer','bigint','smallint','real','double precision'):
-            parts.append(f"coalesce({col}::numeric::text,'Ø')")
-        elif 'timestamp' in dtype or dtype=='date':
-            parts.append(f"coalesce(to_char({col}, 'YYYY-MM-DD\"T\"HH24:MI:SS.MS'),'Ø')")
-        else:
-            parts.append(f"coalesce(rtrim({col}::text),'Ø')")
-    cat = " || '|' || ".join(parts)
+        WHERE table_schema=%s
+        ORDER BY table_name, ordinal_position
+    """, (schema,), stream=True)
+    cols: Dict[str, List[Tuple[str, str]]] = {}
+    for table_name, column_name, data_type in df.itertuples(index=False):
+        cols.setdefault(table_name, []).append((column_name, data_type))
+    return cols
+
+_PG_NUMERIC_TPL = "coalesce({c}::numeric::text,'Ø')"
+_PG_TEMPORAL_TPL = "coalesce(to_char({c}, 'YYYY-MM-DD\"T\"HH24:MI:SS.MS'),'Ø')"
+_PG_OTHER_TPL = "coalesce(rtrim({c}::text),'Ø')"
+
+def _pg_template(dtype: str) -> str:
+    if dtype in PG_NUMERIC_TYPES:
+        return _PG_NUMERIC_TPL
+    if 'timestamp' in dtype or dtype == 'date':
+        return _PG_TEMPORAL_TPL
+    return _PG_OTHER_TPL
+
+def pg_build_cat_expr(columns: List[Tuple[str, str]], schema: str, table: str, qualifier: str = "") -> str:
+    if not columns:
+        raise RuntimeError(f"Failed to build cat expr for {schema}.{table} (no columns?)")
+    return " || '|' || ".join(_pg_template(dtype).format(c=f'{qualifier}"{name}"') for name, dtype in columns)
+
+# --- Server-side cat functions (Postgres, opt-in via pg_cat_functions) ---
+PG_CAT_SCHEMA = "recon"
 
+def pg_cat_function_name(schema: str, table: str) -> str:
+    name = f"cat_{schema}_{table}"
+    if len(name) > 63:  # identifier limit; keep it unique rather than let PG truncate
+        name = name[:46] + "_" + hashlib.sha1(f"{schema}.{table}".encode()).hexdigest()[:16]
+    return name
+
+def pg_cat_function_bodies(conn) -> Dict[str, str]:
+    """Current bodies of the functions in PG_CAT_SCHEMA, by function name.
+
+    Functions not marked PARALLEL SAFE are left out so they get recreated.
+    """
+    df = pg_query_df(conn, """
+        SELECT p.proname, p.prosrc
+        FROM pg_proc p
+        JOIN pg_namespace n ON n.oid = p.pronamespace
+        WHERE n.nspname = %s AND p.proparallel = 's'
+    """, (PG_CAT_SCHEMA,))
+    return dict(df.itertuples(index=False))
+
+def pg_ensure_cat_function(conn, schema: str, table: str, columns: List[Tuple[str, str]], existing: Dict[str, str]) -> str:
+    """Create or refresh the table's concat function when its body changed; returns the call for row alias t."""
+    name = pg_cat_function_name(schema, table)
+    body = f"SELECT {pg_build_cat_expr(columns, schema, table, qualifier='r.')}"
+    if existing.get(name) != body:
+        with conn.cursor() as cur:
+            cur.execute(f'CREATE OR REPLACE FUNCTION {PG_CAT_SCHEMA}."{name}"(r {schema}."{table}") '
+                        f'RETURNS text LANGUAGE sql STABLE PARALLEL SAFE AS $recon${body}$recon$')
+        conn.commit()
+    # t.* is always the whole row; a bare t would resolve to a column named t if the table has one
+    return f'{PG_CAT_SCHEMA}."{name}"(t.*)'
+
+# --- Chunk bucketing by PK range ---
+# Parallel workers Postgres may use for the width_bucket aggregate
+PG_PARALLEL_WORKERS = 8
+
+def pk_is_numeric(columns: List[Tuple[str, str]], pk: Union[str, List[str]], numeric_types: Tuple[str, ...]) -> bool:
+    """True for a single-column PK whose type width_bucket can bucket."""
+    pks = pk_columns(pk)
+    if len(pks) != 1:
+        return False
+    return any(name == pks[0] and dtype in numeric_types for name, dtype in columns)
+
+def pg_pk_range(conn, schema: str, table: str, pk: str) -> Tuple:
+    # read straight off the cursor: driver-native ints/Decimals bind back cleanly, numpy scalars don't
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT min("{pk}"), max("{pk}") FROM {schema}."{table}"')
+        return cur.fetchone()
+
+def ora_pk_range(conn, schema: str, table: str, pk: str) -> Tuple:
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MIN({pk}), MAX({pk}) FROM {schema}.{table}")
+        return cur.fetchone()
+
+def _py_scalar(v):
+    # numpy scalars (e.g. np.int64) neither bind in the drivers nor compare with Decimal
+    return v.item() if hasattr(v, "item") else v
+
+def pk_bucket_bounds(ora_range: Tuple, pg_range: Tuple) -> Optional[Tuple]:
+    """Shared (low, high-exclusive) width_bucket bounds covering both sides' PK ranges.
+
+    Both sides must bucket over the same range for chunk ids to line up.
+    Returns None when both tables are empty.
+    """
+    los = [_py_scalar(r[0]) for r in (ora_range, pg_range) if r[0] is not None]
+    his = [_py_scalar(r[1]) for r in (ora_range, pg_range) if r[1] is not None]
+    if not los or not his:
+        return None
+    return min(los), max(his) + 1
+
+# chunk_sum is numeric and can exceed int64; parse it as an exact Python int
+PG_CHUNK_CONVERTERS = {"chunk_sum": int}
+
+def pg_chunk_sums(conn, schema, table, pk, chunks, cat, bounds: Optional[Tuple]=None):
+    # hashtextextended (PG 11+) is a fast non-cryptographic int8 hash; sum(bigint)
+    # yields numeric, so the per-chunk total cannot overflow
+    if bounds is not None:
+        # width_bucket is a plain per-row function, so unlike NTILE (one sort in
+        # one backend) the aggregate can run as a parallel seq scan
+        with conn.cursor() as cur:
+            cur.execute(f"SET LOCAL max_parallel_workers_per_gather = {PG_PARALLEL_WORKERS}")
+        sql = f"""
+        SELECT 'PG' AS side, %s AS SCHEMA, %s AS TABLE_NAME,
+               width_bucket("{pk_columns(pk)[0]}"::numeric, %s, %s, {chunks}) AS CHUNK_ID,
+               sum(hashtextextended({cat}, 0)) AS CHUNK_SUM,
+               count(*) AS ROWS_IN_CHUNK
+        FROM {schema}."{table}" AS t
+        GROUP BY 4
+        ORDER BY 4;
+        """
+        return pg_copy_df(conn, sql, (schema, f"{schema}.{table}", bounds[0], bounds[1]), converters=PG_CHUNK_CONVERTERS)
+
+    # order on the bare PK columns (no casts) so the planner can walk the PK index
+    order_by = ", ".join(f'"{c}"' for c in pk_columns(pk))
     sql = f"""
     WITH rows AS (
-      SELECT ntile({chunks}) OVER (ORDER BY "{pk}"::text) AS chunk_id,
-             md5({cat}) AS row_hash
-      FROM {schema}."{table}"
+      SELECT ntile({chunks}) OVER (ORDER BY {order_by}) AS chunk_id,
+             hashtextextended({cat}, 0) AS row_hash
+      FROM {schema}."{table}" AS t
     )
     SELECT 'PG' AS side, %s AS SCHEMA, %s AS TABLE_NAME, CHUNK_ID,
-           sum(('x'||substr(row_hash,1,8))::bit(32)::int) AS CHUNK_SUM,
+           sum(row_hash) AS CHUNK_SUM,
            count(*) AS ROWS_IN_CHUNK
     FROM rows
     GROUP BY chunk_id
     ORDER BY chunk_id;
     """
-    return pg_query_df(conn, sql, (schema, f"{schema}.{table}"))
+    return pg_copy_df(conn, sql, (schema, f"{schema}.{table}"), converters=PG_CHUNK_CONVERTERS)
 
 
 # --- Oracle chunked checksum ---
-def ora_chunk_sums(conn, schema: str, table: str, pk: str, chunks: int, cat_expr: str) -> pd.DataFrame:
+def ora_chunk_sums(conn, schema: str, table: str, pk: Union[str, List[str]], chunks: int, cat_expr: str,
+                   bounds: Optional[Tuple]=None) -> pd.DataFrame:
+    if bounds is not None:
+        # bucket once in the CTE: repeating WIDTH_BUCKET(..., :lo, :hi, ...) in GROUP BY
+        # gives separate bind placeholders and Oracle rejects it (ORA-00979)
+        sql = f"""
+        WITH records AS (
+        SELECT WIDTH_BUCKET({pk_columns(pk)[0]}, :lo, :hi, {chunks}) AS chunk_id,
+                ORA_HASH({cat_expr}, 4294967295) AS row_hash
+        FROM   {schema}.{table}
+        )
+        SELECT 'ORA' AS side, '{schema}' AS schema, '{table}' AS table_name, chunk_id,
+            SUM(row_hash) AS chunk_sum, COUNT(*) AS rows_in_chunk
+        FROM records
+        GROUP BY chunk_id
+        ORDER BY chunk_id
+        """
+        return ora_query_df(conn, sql, {"lo": bounds[0], "hi": bounds[1]}, arraysize=chunks + 1)
+
+    order_by = ", ".join(pk_columns(pk))
     sql = f"""
     WITH records AS (
-    SELECT NTILE('{chunks}') OVER (ORDER BY {pk}) AS chunk_id,
+    SELECT NTILE('{chunks}') OVER (ORDER BY {order_by}) AS chunk_id,
             ORA_HASH({cat_expr}, 4294967295) AS row_hash
     FROM   {schema}.{table}
     )
@@ -202,7 +521,8 @@ def ora_chunk_sums(conn, schema: str, table: str, pk: str, chunks: int, cat_expr
     GROUP BY chunk_id
     ORDER BY chunk_id
     """
-    return ora_query_df(conn, sql)
+    # at most `chunks` rows come back, so fetch them all with the execute round-trip
+    return ora_query_df(conn, sql, arraysize=chunks + 1)
 # --- FK orphan SQL generator (Postgres) ---
 def pg_generate_fk_checks(conn, schema: str) -> List[str]:
     sql = """
@@ -232,23 +552,78 @@ def pg_generate_fk_checks(conn, schema: str) -> List[str]:
     FROM fks;
     """
     df = pg_query_df(conn, sql, (schema,))
-    return [row[0] for row in df.to_records(index=False)]
+    return df.iloc[:, 0].tolist()
 
 def safe_int(x) -> int:
     try: return int(x)
     except: return 0
 
-def compare_chunks(ora_df: pd.DataFrame, pg_df: pd.DataFrame) -> pd.DataFrame:
-    pg_df.columns = [c.upper() for c in pg_df.columns]
+MISMATCH_COLUMNS = ["SCHEMA", "TABLE_NAME", "CHUNK_ID", "CHUNK_SUM_ora", "CHUNK_SUM_pg", "ROWS_IN_CHUNK_ora", "ROWS_IN_CHUNK_pg"]
+
+def compare_chunks(ora_df: pd.DataFrame, pg_df: pd.DataFrame, schema: str, table: str) -> pd.DataFrame:
+    """Chunks whose checksums differ, or that exist on one side only, under the Oracle schema/table."""
     try:
-        j = ora_df.merge(pg_df, on=["SCHEMA", "TABLE_NAME", "CHUNK_ID"], suffixes=("_ora", "_pg"))
-        j["match"] = j["CHUNK_SUM_ora"] == j["CHUNK_SUM_pg"]
-        mism = j[j["match"] == False][["SCHEMA", "TABLE_NAME", "CHUNK_ID", "CHUNK_SUM_ora", "CHUNK_SUM_pg", "ROWS_IN_CHUNK_ora", "ROWS_IN_CHUNK_pg"]]
-        return mism
+        pg = pg_df.rename(columns=str.upper)
+        pg_map = {chunk_id: (chunk_sum, rows)
+                  for chunk_id, chunk_sum, rows in pg[["CHUNK_ID", "CHUNK_SUM", "ROWS_IN_CHUNK"]].itertuples(index=False, name=None)}
+        mism = []
+        for chunk_id, chunk_sum, rows in ora_df[["CHUNK_ID", "CHUNK_SUM", "ROWS_IN_CHUNK"]].itertuples(index=False, name=None):
+            pg_row = pg_map.pop(chunk_id, None)
+            if pg_row is None:
+                mism.append((schema, table, chunk_id, chunk_sum, None, rows, None))
+            elif chunk_sum != pg_row[0]:
+                mism.append((schema, table, chunk_id, chunk_sum, pg_row[0], rows, pg_row[1]))
+        for chunk_id, (chunk_sum, rows) in pg_map.items():
+            mism.append((schema, table, chunk_id, None, chunk_sum, None, rows))
+        # object dtype keeps wide chunk sums exact instead of letting pandas float them
+        df = pd.DataFrame(mism, columns=MISMATCH_COLUMNS, dtype=object)
+        return df.astype({"CHUNK_ID": "int64", "ROWS_IN_CHUNK_ora": "Int64", "ROWS_IN_CHUNK_pg": "Int64"})
     except Exception as e:
         print(f"Error in compare_chunks: {e}")
         return pd.DataFrame()
 
+# --- CSV reports (pyarrow's C++ writer instead of DataFrame.to_csv) ---
+SUMMARY_SCHEMA = pa.schema([
+    ("side", pa.string()), ("schema", pa.string()), ("table", pa.string()),
+    ("rows_exact", pa.int64()), ("rows_estimate", pa.int64()),
+])
+# Chunk sums are text: Postgres sums of int8 hashes can exceed int64
+CHUNKS_SCHEMA = pa.schema([
+    ("SIDE", pa.string()), ("SCHEMA", pa.string()), ("TABLE_NAME", pa.string()),
+    ("CHUNK_ID", pa.int64()), ("CHUNK_SUM", pa.string()), ("ROWS_IN_CHUNK", pa.int64()),
+])
+MISMATCH_SCHEMA = pa.schema([
+    ("SCHEMA", pa.string()), ("TABLE_NAME", pa.string()), ("CHUNK_ID", pa.int64()),
+    ("CHUNK_SUM_ora", pa.string()), ("CHUNK_SUM_pg", pa.string()),
+    ("ROWS_IN_CHUNK_ora", pa.int64()), ("ROWS_IN_CHUNK_pg", pa.int64()),
+])
+
+def _nullable_str(v):
+    return None if v is None or pd.isna(v) else str(v)
+
+def _nullable_int(v):
+    return None if v is None or pd.isna(v) else int(v)
+
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    # object columns may hold ints wider than int64 (chunk sums); write them as text
+    df = df.copy()
+    for c in df.columns[df.dtypes == object]:
+        df[c] = df[c].map(_nullable_str).astype("string")
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+def open_csv_writer(path: str, schema: pa.Schema) -> pa_csv.CSVWriter:
+    """Streaming CSV report writer; append rows_table() batches as results arrive."""
+    return pa_csv.CSVWriter(path, schema)
+
+def rows_table(rows: List[tuple], schema: pa.Schema) -> pa.Table:
+    """Row tuples -> pyarrow table, coercing each value to its column's type (str or int)."""
+    cols = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = []
+    for values, field in zip(cols, schema):
+        conv = _nullable_str if pa.types.is_string(field.type) else _nullable_int
+        arrays.append([conv(v) for v in values])
+    return pa.table(arrays, schema=schema)
+
 def ensure_output_dir(path: str):
     import os
     os.makedirs(path, exist_ok=True)
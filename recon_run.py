@@ -3,13 +3,87 @@
 import os
 import sys
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from recon_lib import (
-    fetch_oracle_tables, load_config, load_tables, connect_oracle, connect_postgres,
-    pg_count, ora_count, ora_build_cat_expr,
+    TableSpec, Config, borrow_connections, fetch_oracle_tables, load_config, load_tables, create_oracle_pool, create_postgres_pool,
+    pg_counts, ora_counts, pg_count_estimates, ora_count_estimates, needs_exact_count,
+    ora_fetch_columns_cached, pg_fetch_columns, ora_build_cat_expr, pg_build_cat_expr,
+    PG_CAT_SCHEMA, pg_cat_function_bodies, pg_ensure_cat_function,
+    pk_is_numeric, pg_pk_range, ora_pk_range, pk_bucket_bounds, PG_NUMERIC_TYPES, ORA_NUMERIC_TYPES,
     pg_chunk_sums, ora_chunk_sums, compare_chunks,
-    pg_generate_fk_checks, ensure_output_dir
+    pg_generate_fk_checks, pg_query_df, ensure_output_dir,
+    write_csv, open_csv_writer, rows_table, SUMMARY_SCHEMA, CHUNKS_SCHEMA, MISMATCH_SCHEMA
 )
 
+# Tables above this many rows get counts only, no chunk checksum
+CHUNK_CHECKSUM_MAX_ROWS = 50000
+
+def run_sides(side_pool, ora_fn, pg_fn):
+    """Run the Oracle and Postgres halves of a step at the same time.
+
+    ora_fn goes to side_pool while pg_fn runs on the calling thread, so the two
+    databases work in parallel instead of back to back. Returns (ora_result, pg_result).
+    """
+    ora_fut = side_pool.submit(ora_fn)
+    try:
+        pg_result = pg_fn()
+    except Exception:
+        # don't hand the Oracle connection back while ora_fn is still using it
+        wait([ora_fut])
+        raise
+    return ora_fut.result(), pg_result
+
+def process_table(t: TableSpec, cfg: Config, ora_pool, pg_pool, ora_cols, pg_cols, side_pool, pg_cat_bodies):
+    """Chunk-checksum one table on connections borrowed from the pools.
+
+    Returns (chunks_rows, diff); diff is None when no chunk mismatches were found.
+    """
+    tag = f"[{t.ora_schema}.{t.ora_table}]"
+    chunks_rows = []
+    diff = None
+
+    # psycopg2 and oracledb connections are not thread-safe: one pair per worker,
+    # and each connection is only ever used by one thread at a time
+    with borrow_connections(ora_pool, pg_pool, tag) as (ora, pg):
+        # Chunked checksum
+        try:
+            ora_tcols = ora_cols.get(t.ora_table.upper(), [])
+            pg_tcols  = pg_cols.get(t.pg_table, [])
+            ora_cat = ora_build_cat_expr(ora_tcols, t.ora_schema, t.ora_table)
+            if pg_cat_bodies is not None:
+                pg_cat = pg_ensure_cat_function(pg, cfg.postgres["schema"], t.pg_table, pg_tcols, pg_cat_bodies)
+            else:
+                pg_cat = pg_build_cat_expr(pg_tcols, cfg.postgres["schema"], t.pg_table)
+            # Numeric single-column PKs are bucketed by value range (parallelizable);
+            # anything else falls back to NTILE over the PK order
+            bounds = None
+            if pk_is_numeric(ora_tcols, t.pk, ORA_NUMERIC_TYPES) and pk_is_numeric(pg_tcols, t.pk.lower(), PG_NUMERIC_TYPES):
+                bounds = pk_bucket_bounds(*run_sides(side_pool,
+                    lambda: ora_pk_range(ora, t.ora_schema, t.ora_table, t.pk),
+                    lambda: pg_pk_range(pg, cfg.postgres["schema"], t.pg_table, t.pk.lower())))
+            ora_chunks, pg_chunks = run_sides(side_pool,
+                lambda: ora_chunk_sums(ora, t.ora_schema, t.ora_table, t.pk, t.chunks, ora_cat, bounds),
+                lambda: pg_chunk_sums(pg,  cfg.postgres["schema"],  t.pg_table,  t.pk.lower(), t.chunks, pg_cat, bounds))
+            chunks_rows.extend(ora_chunks.itertuples(index=False, name=None))
+            chunks_rows.extend(pg_chunks.itertuples(index=False, name=None))
+            d = compare_chunks(ora_chunks, pg_chunks, t.ora_schema, t.ora_table)
+            if not d.empty:
+                print(f"  {tag} Chunk checksum mismatches: {len(d)} (see mismatched_chunks.csv; cross-engine sums not comparable yet)")
+                diff = d
+            else:
+                print(f"  {tag} Chunk checksums -> MATCH")
+        except Exception as e:
+            print(f"  {tag} [ERROR] Chunk checksum failed: {e}")
+    return chunks_rows, diff
+
+def run_fk_check(sql: str, pg_pool):
+    """Run one FK orphan query on a pooled connection; returns its (fk_name, orphan_rows) rows."""
+    pg = pg_pool.getconn()
+    try:
+        return list(pg_query_df(pg, sql).itertuples(index=False, name=None))
+    finally:
+        pg_pool.putconn(pg)
+
 def main():
     cfg_path = "config.yaml"
     tbl_path = "tables.csv"
@@ -18,109 +92,176 @@ def main():
     cfg = load_config(cfg_path)
     # tables = load_tables(tbl_path, cfg.default_chunks)
     ensure_output_dir(cfg.output_dir)
+    pg_schema = cfg.postgres["schema"]
 
     # Connections
     print("Connecting to Oracle and Postgres...")
-    ora = connect_oracle(cfg)
-    pg  = connect_postgres(cfg)
-    tables = fetch_oracle_tables(ora, cfg.oracle["schema"], cfg.default_chunks)
+    ora_pool = create_oracle_pool(cfg)
+    pg_pool  = create_postgres_pool(cfg)
+    # Oracle halves of paired Oracle/Postgres steps run here, overlapping the Postgres half
+    side_pool = ThreadPoolExecutor(max_workers=cfg.max_workers)
+    with borrow_connections(ora_pool, pg_pool) as (ora, pg):
+        tables = fetch_oracle_tables(ora, cfg.oracle["schema"], cfg.default_chunks)
+        # Large tables skip the chunk checksum anyway, so when their optimizer
+        # estimates agree there is no need to scan them for an exact count
+        ora_est, pg_est = {}, {}
+        if cfg.fast_counts:
+            ora_est, pg_est = run_sides(side_pool,
+                lambda: ora_count_estimates(ora, cfg.oracle["schema"]),
+                lambda: pg_count_estimates(pg, pg_schema))
+        exact = [t for t in tables if needs_exact_count(
+            ora_est.get(f"{t.ora_schema}.{t.ora_table}"), pg_est.get(f"{pg_schema}.{t.pg_table}"), CHUNK_CHECKSUM_MAX_ROWS)]
+        # Row counts: one batched round-trip per side instead of two per table
+        (ora_rows, ora_errors), (pg_rows, pg_errors) = run_sides(side_pool,
+            lambda: ora_counts(ora, [(t.ora_schema, t.ora_table) for t in exact]),
+            lambda: pg_counts(pg, [(pg_schema, t.pg_table) for t in exact]))
 
-    counts_rows = []
-    chunks_rows = []
-    mismatches = []
     missing_tables = []  # Track missing tables
+    count_mismatches = []
+    to_checksum = []
 
-    for t in tables:
-        print(f"\n=== Table: {t.ora_schema}.{t.ora_table}  <->  {cfg.postgres['schema']}.{t.pg_table} (pk={t.pk}, chunks={t.chunks}) ===")
-
-        # Row counts
-        try:
-            ora_c = ora_count(ora, t.ora_schema, t.ora_table)
-            pg_c  = pg_count(pg, cfg.postgres["schema"], t.pg_table)
-        except Exception as e:
-            print(f"  [ERROR] Counting rows failed: {e}")
-            # Add missing table info
-            missing_tables.append({
-                "ORA_SCHEMA": t.ora_schema,
-                "ORA_TABLE": t.ora_table,
-                "PG_SCHEMA": cfg.postgres["schema"],
-                "PG_TABLE": t.pg_table,
-                "ERROR": str(e)
-            })
-            try:    
-                pg.rollback()
-            except Exception as e:
-                print(f"  [ERROR] Rolling back Postgres transaction failed: {e}")
-            continue
-
-        counts_rows.append(["ORA", t.ora_schema, t.ora_table, ora_c])
-        counts_rows.append(["PG",  cfg.postgres["schema"], t.pg_table, pg_c])
-        print(f"  Counts -> Oracle: {ora_c:,} | Postgres: {pg_c:,} | {'MATCH' if ora_c==pg_c else 'DIFF'}")
+    # Counts are streamed to recon_summary.csv table by table
+    with open_csv_writer(os.path.join(cfg.output_dir, "recon_summary.csv"), SUMMARY_SCHEMA) as summary_out:
+        for t in tables:
+            print(f"\n=== Table: {t.ora_schema}.{t.ora_table}  <->  {pg_schema}.{t.pg_table} (pk={t.pk}, chunks={t.chunks}) ===")
+            ora_key = f"{t.ora_schema}.{t.ora_table}"
+            pg_key  = f"{pg_schema}.{t.pg_table}"
+            error = ora_errors.get(ora_key) or pg_errors.get(pg_key)
+            if error is not None:
+                print(f"  [ERROR] Counting rows failed: {error}")
+                # Add missing table info
+                missing_tables.append({
+                    "ORA_SCHEMA": t.ora_schema,
+                    "ORA_TABLE": t.ora_table,
+                    "PG_SCHEMA": pg_schema,
+                    "PG_TABLE": t.pg_table,
+                    "ERROR": error
+                })
+                continue
 
-        # Chunked checksum
-        try:
-            if ora_c > 50000:
-                print("  Skipping chunk checksum (row count >= 50,000)")
+            if ora_key not in ora_rows:
+                ora_e = ora_est[ora_key]
+                pg_e  = pg_est[pg_key]
+                summary_out.write_table(rows_table([
+                    ("ORA", t.ora_schema, t.ora_table, None, ora_e),
+                    ("PG",  pg_schema, t.pg_table, None, pg_e),
+                ], SUMMARY_SCHEMA))
+                print(f"  Counts (estimated) -> Oracle: ~{ora_e:,} | Postgres: ~{pg_e:,}")
+                print(f"  Skipping chunk checksum (row count >= {CHUNK_CHECKSUM_MAX_ROWS:,})")
                 continue
-            cat_expr = ora_build_cat_expr(ora, t.ora_schema, t.ora_table)
-            ora_chunks = ora_chunk_sums(ora, t.ora_schema, t.ora_table, t.pk, t.chunks, cat_expr)
-            pg_chunks  = pg_chunk_sums(pg,  cfg.postgres["schema"],  t.pg_table,  t.pk.lower(), t.chunks)  
-            chunks_rows.extend(ora_chunks.to_records(index=False).tolist())
-            chunks_rows.extend(pg_chunks.to_records(index=False).tolist())
-            diff = compare_chunks(ora_chunks, pg_chunks)
-            if not diff.empty:
-                print(f"  Chunk checksum mismatches: {len(diff)} (see mismatched_chunks.csv)")
-                mismatches.append(diff)
-            else:
-                print("  Chunk checksums -> MATCH")
-        except Exception as e:
-            print(f"  [ERROR] Chunk checksum failed: {e}")
 
-    # Save counts
-    counts_df = pd.DataFrame(counts_rows, columns=["side","schema","table","rows_exact"])
-    counts_df.to_csv(os.path.join(cfg.output_dir, "recon_summary.csv"), index=False)
+            ora_c = ora_rows[ora_key]
+            pg_c  = pg_rows[pg_key]
+            summary_out.write_table(rows_table([
+                ("ORA", t.ora_schema, t.ora_table, ora_c, None),
+                ("PG",  pg_schema, t.pg_table, pg_c, None),
+            ], SUMMARY_SCHEMA))
+            print(f"  Counts -> Oracle: {ora_c:,} | Postgres: {pg_c:,} | {'MATCH' if ora_c==pg_c else 'DIFF'}")
 
-    # Save chunks
-    if chunks_rows:
-        chunks_df = pd.DataFrame(chunks_rows, columns=["SIDE","SCHEMA","TABLE_NAME","CHUNK_ID","CHUNK_SUM","ROWS_IN_CHUNK"])
-        chunks_df.to_csv(os.path.join(cfg.output_dir, "recon_chunks.csv"), index=False)
-    else:
-        chunks_df = pd.DataFrame(columns=["SIDE","SCHEMA","TABLE_NAME","CHUNK_ID","CHUNK_SUM","ROWS_IN_CHUNK"])
+            # A count difference already proves the table diverged; the checksum adds nothing
+            if ora_c != pg_c:
+                count_mismatches.append({
+                    "ORA_SCHEMA": t.ora_schema,
+                    "ORA_TABLE": t.ora_table,
+                    "PG_SCHEMA": pg_schema,
+                    "PG_TABLE": t.pg_table,
+                    "ORA_ROWS": ora_c,
+                    "PG_ROWS": pg_c,
+                    "DIFF": ora_c - pg_c
+                })
+                print("  Skipping chunk checksum (row counts differ, see count_mismatches.csv)")
+                continue
+            if ora_c > CHUNK_CHECKSUM_MAX_ROWS:
+                print(f"  Skipping chunk checksum (row count >= {CHUNK_CHECKSUM_MAX_ROWS:,})")
+                continue
+            if not t.pk:
+                print("  Skipping chunk checksum (no primary key)")
+                continue
+            to_checksum.append(t)
 
-    # Save mismatches
-    if mismatches:
-        mism_df = pd.concat(mismatches, ignore_index=True)
-    else:
-        mism_df = pd.DataFrame(columns=["SCHEMA","TABLE_NAME","CHUNK_ID","CHUNK_SUM_ora","CHUNK_SUM_pg","ROWS_IN_CHUNK_ora","ROWS_IN_CHUNK_pg"])
-    mism_df.to_csv(os.path.join(cfg.output_dir, "mismatched_chunks.csv"), index=False)
+    # Tables are independent and mostly wait on DB round-trips, so overlap them.
+    # Chunk and mismatch rows are streamed to disk as each table finishes.
+    with open_csv_writer(os.path.join(cfg.output_dir, "recon_chunks.csv"), CHUNKS_SCHEMA) as chunks_out, \
+         open_csv_writer(os.path.join(cfg.output_dir, "mismatched_chunks.csv"), MISMATCH_SCHEMA) as mism_out:
+        if to_checksum:
+            print(f"\nComputing chunk checksums for {len(to_checksum)} table(s)...")
+            print("  [WARN] Oracle (ORA_HASH) and Postgres (hashtextextended) chunk sums are not comparable yet;")
+            print("         expect every chunk in mismatched_chunks.csv. Trust the row counts, not the chunk verdicts.")
+            # Column metadata for the whole schema up front, not one dictionary query per table
+            with borrow_connections(ora_pool, pg_pool) as (ora, pg):
+                ora_cols, pg_cols = run_sides(side_pool,
+                    lambda: ora_fetch_columns_cached(ora, cfg.oracle["schema"], os.path.join(cfg.output_dir, ".cat_cache.sqlite")),
+                    lambda: pg_fetch_columns(pg, pg_schema))
+                # Optional: keep each table's concat expression server-side as a SQL function
+                pg_cat_bodies = None
+                if cfg.pg_cat_functions:
+                    with pg.cursor() as cur:
+                        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {PG_CAT_SCHEMA}")
+                    pg.commit()
+                    pg_cat_bodies = pg_cat_function_bodies(pg)
+            n_workers = max(1, min(len(to_checksum), cfg.max_workers))
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                futures = {pool.submit(process_table, t, cfg, ora_pool, pg_pool, ora_cols, pg_cols, side_pool, pg_cat_bodies): t for t in to_checksum}
+                for fut in as_completed(futures):
+                    t = futures[fut]
+                    try:
+                        t_chunks, diff = fut.result()
+                    except Exception as e:
+                        print(f"  [{t.ora_schema}.{t.ora_table}] [ERROR] Chunk checksum failed: {e}")
+                        continue
+                    if t_chunks:
+                        chunks_out.write_table(rows_table(t_chunks, CHUNKS_SCHEMA))
+                    if diff is not None:
+                        mism_out.write_table(rows_table(list(diff.itertuples(index=False, name=None)), MISMATCH_SCHEMA))
 
     # Optional: FK orphan checks on Postgres
     if fk_schema:
         print(f"\nRunning FK orphan checks on schema: {fk_schema}")
         try:
-            from recon_lib import pg_query_df  # type: ignore
-            sqls = pg_generate_fk_checks(pg, fk_schema)
+            pg = pg_pool.getconn()
+            try:
+                sqls = pg_generate_fk_checks(pg, fk_schema)
+            finally:
+                pg_pool.putconn(pg)
+            # each check is an independent anti-join scan, so run them side by side
             fk_rows = []
-            for s in sqls:
-                df = pg_query_df(pg, s)
-                fk_rows.extend(df.to_records(index=False).tolist())
+            if sqls:
+                with ThreadPoolExecutor(max_workers=min(len(sqls), cfg.max_workers)) as pool:
+                    futures = [pool.submit(run_fk_check, s, pg_pool) for s in sqls]
+                    for fut in as_completed(futures):
+                        try:
+                            fk_rows.extend(fut.result())
+                        except Exception as e:
+                            print(f"  [WARN] FK check failed: {e}")
             fk_df = pd.DataFrame(fk_rows, columns=["fk_name","orphan_rows"])
-            fk_df.to_csv(os.path.join(cfg.output_dir, f"fk_orphans_{fk_schema}.csv"), index=False)
+            write_csv(fk_df, os.path.join(cfg.output_dir, f"fk_orphans_{fk_schema}.csv"))
             print(f"  FK orphan report -> fk_orphans_{fk_schema}.csv")
         except Exception as e:
             print(f"  [WARN] FK check failed: {e}")
 
+    # Save count mismatches
+    if count_mismatches:
+        count_mism_df = pd.DataFrame(count_mismatches)
+    else:
+        count_mism_df = pd.DataFrame(columns=["ORA_SCHEMA","ORA_TABLE","PG_SCHEMA","PG_TABLE","ORA_ROWS","PG_ROWS","DIFF"])
+    write_csv(count_mism_df, os.path.join(cfg.output_dir, "count_mismatches.csv"))
+
     # Save missing tables
     if missing_tables:
         missing_df = pd.DataFrame(missing_tables)
     else:
         missing_df = pd.DataFrame(columns=["ORA_SCHEMA","ORA_TABLE","PG_SCHEMA","PG_TABLE","ERROR"])
-    missing_df.to_csv(os.path.join(cfg.output_dir, "missing_tables.csv"), index=False)
+    write_csv(missing_df, os.path.join(cfg.output_dir, "missing_tables.csv"))
+
+    side_pool.shutdown()
+    pg_pool.closeall()
+    ora_pool.close()
 
     print("\nDone. Reports written to:", cfg.output_dir)
     print(" - recon_summary.csv")
     print(" - recon_chunks.csv")
     print(" - mismatched_chunks.csv")
+    print(" - count_mismatches.csv")
     print(" - missing_tables.csv")
     if fk_schema:
         print(f" - fk_orphans_{fk_schema}.csv")
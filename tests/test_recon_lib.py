@@ -0,0 +1,270 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import recon_lib
+from recon_lib import (
+    ESTIMATE_TOLERANCE, borrow_connections, compare_chunks, needs_exact_count,
+    ora_build_cat_expr, ora_fetch_columns_cached, pg_build_cat_expr, pg_cat_function_name, pg_counts,
+    pg_ensure_cat_function, pk_bucket_bounds,
+)
+
+
+def test_pk_bucket_bounds_int_int():
+    lo, hi = pk_bucket_bounds((1, 500), (3, 480))
+    assert (lo, hi) == (1, 501)
+    assert type(lo) is int and type(hi) is int
+
+
+def test_pk_bucket_bounds_numpy_scalars_become_python_ints():
+    lo, hi = pk_bucket_bounds((np.int64(1), np.int64(500)), (np.int64(2), np.int64(499)))
+    assert (lo, hi) == (1, 501)
+    assert type(lo) is int and type(hi) is int
+
+
+def test_pk_bucket_bounds_decimal_int():
+    assert pk_bucket_bounds((Decimal("0.5"), Decimal("99.5")), (1, 120)) == (Decimal("0.5"), 121)
+    assert pk_bucket_bounds((np.int64(2), np.int64(10)), (Decimal("1"), Decimal("9"))) == (Decimal("1"), 11)
+
+
+def test_pk_bucket_bounds_one_side_empty():
+    assert pk_bucket_bounds((None, None), (5, 10)) == (5, 11)
+
+
+def test_pk_bucket_bounds_both_empty():
+    assert pk_bucket_bounds((None, None), (None, None)) is None
+
+
+def test_compare_chunks_labels_every_row_with_oracle_identifiers():
+    ora = pd.DataFrame([("ORA", "APP", "ORDERS", 1, 100, 5), ("ORA", "APP", "ORDERS", 2, 200, 5)],
+                       columns=["SIDE", "SCHEMA", "TABLE_NAME", "CHUNK_ID", "CHUNK_SUM", "ROWS_IN_CHUNK"])
+    pg = pd.DataFrame([("PG", "public", "public.orders", 1, 100, 5), ("PG", "public", "public.orders", 3, 2**70, 4)],
+                      columns=["side", "schema", "table_name", "chunk_id", "chunk_sum", "rows_in_chunk"])
+    mism = compare_chunks(ora, pg, "APP", "ORDERS")
+    assert set(mism["SCHEMA"]) == {"APP"} and set(mism["TABLE_NAME"]) == {"ORDERS"}
+    assert list(mism["CHUNK_ID"]) == [2, 3]
+    assert mism["CHUNK_SUM_pg"].iloc[1] == 2**70
+
+
+class FakeOracleDictionary:
+    """Stands in for ora_query_df: serves ALL_OBJECTS / ALL_TAB_COLUMNS from dicts."""
+
+    def __init__(self, tables):
+        self.tables = tables  # {table_name: (ddl_time, [(column, dtype), ...])}
+        self.column_queries = 0
+
+    def __call__(self, conn, sql, params=None, arraysize=None):
+        if "all_objects" in sql:
+            return pd.DataFrame([(t, ddl) for t, (ddl, _) in self.tables.items()], columns=["OBJECT_NAME", "DDL_TIME"])
+        self.column_queries += 1
+        return pd.DataFrame([(t, c, d) for t, (_, cols) in self.tables.items() for c, d in cols],
+                            columns=["TABLE_NAME", "COLUMN_NAME", "DATA_TYPE"])
+
+
+@pytest.fixture
+def ora_dict(monkeypatch):
+    fake = FakeOracleDictionary({
+        "ORDERS": ("2024-01-01 00:00:00", [("ID", "NUMBER"), ("PLACED", "DATE")]),
+        "ITEMS": ("2024-01-01 00:00:00", [("ID", "NUMBER"), ("SKU", "VARCHAR2")]),
+    })
+    monkeypatch.setattr(recon_lib, "ora_query_df", fake)
+    return fake
+
+
+def test_ora_fetch_columns_cached_hit_skips_column_query(ora_dict, tmp_path):
+    cache = str(tmp_path / "cache.sqlite")
+    first = ora_fetch_columns_cached(None, "app", cache)
+    second = ora_fetch_columns_cached(None, "app", cache)
+    assert ora_dict.column_queries == 1
+    assert second == first == {"ORDERS": [("ID", "NUMBER"), ("PLACED", "DATE")],
+                                "ITEMS": [("ID", "NUMBER"), ("SKU", "VARCHAR2")]}
+
+
+def test_ora_fetch_columns_cached_refetches_when_ddl_time_changes(ora_dict, tmp_path):
+    cache = str(tmp_path / "cache.sqlite")
+    ora_fetch_columns_cached(None, "app", cache)
+    ora_dict.tables["ITEMS"] = ("2024-02-01 00:00:00", [("ID", "NUMBER"), ("SKU", "VARCHAR2"), ("QTY", "NUMBER")])
+    cols = ora_fetch_columns_cached(None, "app", cache)
+    assert ora_dict.column_queries == 2
+    assert cols["ITEMS"] == [("ID", "NUMBER"), ("SKU", "VARCHAR2"), ("QTY", "NUMBER")]
+    # the refreshed entry is cached in turn
+    assert ora_fetch_columns_cached(None, "app", cache) == cols
+    assert ora_dict.column_queries == 2
+
+
+def test_ora_fetch_columns_cached_drops_removed_tables(ora_dict, tmp_path):
+    cache = str(tmp_path / "cache.sqlite")
+    ora_fetch_columns_cached(None, "app", cache)
+    del ora_dict.tables["ITEMS"]
+    assert set(ora_fetch_columns_cached(None, "app", cache)) == {"ORDERS"}
+    ora_dict.tables["ORDERS"] = ("2024-03-01 00:00:00", [("ID", "NUMBER")])
+    assert ora_fetch_columns_cached(None, "app", cache) == {"ORDERS": [("ID", "NUMBER")]}
+    assert ora_dict.column_queries == 2
+
+
+def test_ora_fetch_columns_cached_refetches_for_new_table(ora_dict, tmp_path):
+    cache = str(tmp_path / "cache.sqlite")
+    ora_fetch_columns_cached(None, "app", cache)
+    ora_dict.tables["SHIPMENTS"] = ("2024-01-05 00:00:00", [("ID", "NUMBER")])
+    assert ora_fetch_columns_cached(None, "app", cache)["SHIPMENTS"] == [("ID", "NUMBER")]
+    assert ora_dict.column_queries == 2
+
+
+# Expected fragments spelled out as the old per-column if/elif mapping produced them
+ORA_CAT_CASES = [
+    ("C_DATE", "DATE", "NVL(TO_CHAR(C_DATE,'YYYY-MM-DD\"T\"HH24:MI:SS.FF3'),'∅')"),
+    ("C_TS", "TIMESTAMP", "NVL(TO_CHAR(C_TS,'YYYY-MM-DD\"T\"HH24:MI:SS.FF3'),'∅')"),
+    ("C_TSTZ", "TIMESTAMP WITH TIME ZONE", "NVL(TO_CHAR(C_TSTZ,'YYYY-MM-DD\"T\"HH24:MI:SS.FF3'),'∅')"),
+    ("C_NUM", "NUMBER", "NVL(TO_CHAR(C_NUM,'FM999999990D999999999'),'∅')"),
+    ("C_FLT", "FLOAT", "NVL(TO_CHAR(C_FLT,'FM999999990D999999999'),'∅')"),
+    ("C_VC", "VARCHAR2", "NVL(RTRIM(C_VC),'∅')"),
+    ("C_CHR", "CHAR", "NVL(RTRIM(C_CHR),'∅')"),
+    ("C_NVC", "NVARCHAR2", "NVL(RTRIM(C_NVC),'∅')"),
+    ("C_CLOB", "CLOB", "NVL(RTRIM(C_CLOB),'∅')"),
+    ("C_NCLOB", "NCLOB", "NVL(RTRIM(C_NCLOB),'∅')"),
+    ("C_RAW", "RAW", "NVL(TO_CHAR(C_RAW),'∅')"),
+]
+
+PG_CAT_CASES = [
+    ("c_int", "integer", "coalesce(\"c_int\"::numeric::text,'Ø')"),
+    ("c_big", "bigint", "coalesce(\"c_big\"::numeric::text,'Ø')"),
+    ("c_num", "numeric", "coalesce(\"c_num\"::numeric::text,'Ø')"),
+    ("c_dbl", "double precision", "coalesce(\"c_dbl\"::numeric::text,'Ø')"),
+    ("c_ts", "timestamp without time zone", "coalesce(to_char(\"c_ts\", 'YYYY-MM-DD\"T\"HH24:MI:SS.MS'),'Ø')"),
+    ("c_tstz", "timestamp with time zone", "coalesce(to_char(\"c_tstz\", 'YYYY-MM-DD\"T\"HH24:MI:SS.MS'),'Ø')"),
+    ("c_date", "date", "coalesce(to_char(\"c_date\", 'YYYY-MM-DD\"T\"HH24:MI:SS.MS'),'Ø')"),
+    ("c_text", "text", "coalesce(rtrim(\"c_text\"::text),'Ø')"),
+    ("c_vc", "character varying", "coalesce(rtrim(\"c_vc\"::text),'Ø')"),
+    ("c_bytes", "bytea", "coalesce(rtrim(\"c_bytes\"::text),'Ø')"),
+]
+
+
+@pytest.mark.parametrize("name,dtype,expected", ORA_CAT_CASES)
+def test_ora_build_cat_expr_fragment(name, dtype, expected):
+    assert ora_build_cat_expr([(name, dtype)], "APP", "T") == expected
+
+
+@pytest.mark.parametrize("name,dtype,expected", PG_CAT_CASES)
+def test_pg_build_cat_expr_fragment(name, dtype, expected):
+    assert pg_build_cat_expr([(name, dtype)], "app", "t") == expected
+
+
+def test_build_cat_expr_joins_columns_in_order():
+    assert ora_build_cat_expr([(n, d) for n, d, _ in ORA_CAT_CASES], "APP", "T") == "||'|'||".join(e for _, _, e in ORA_CAT_CASES)
+    assert pg_build_cat_expr([(n, d) for n, d, _ in PG_CAT_CASES], "app", "t") == " || '|' || ".join(e for _, _, e in PG_CAT_CASES)
+
+
+def test_build_cat_expr_rejects_empty_column_list():
+    with pytest.raises(RuntimeError):
+        ora_build_cat_expr([], "APP", "T")
+    with pytest.raises(RuntimeError):
+        pg_build_cat_expr([], "app", "t")
+
+
+@pytest.mark.parametrize("ora_est,pg_est", [(None, 1_000_000), (1_000_000, None), (None, None)])
+def test_needs_exact_count_missing_estimate(ora_est, pg_est):
+    assert needs_exact_count(ora_est, pg_est, 50_000)
+
+
+def test_needs_exact_count_at_min_rows():
+    assert needs_exact_count(50_000, 50_000, 50_000)
+    assert needs_exact_count(50_000, 1_000_000, 50_000)
+    assert not needs_exact_count(50_001, 50_001, 50_000)
+
+
+def test_needs_exact_count_tolerance_boundary():
+    # gap of exactly ESTIMATE_TOLERANCE * max still counts as agreeing
+    assert ESTIMATE_TOLERANCE == 0.1
+    assert not needs_exact_count(1_000_000, 900_000, 50_000)
+    assert not needs_exact_count(900_000, 1_000_000, 50_000)
+    assert needs_exact_count(1_000_000, 899_999, 50_000)
+    assert needs_exact_count(899_999, 1_000_000, 50_000)
+
+
+class FakePool:
+    def __init__(self, fail_get=False, fail_put=False):
+        self.out, self.fail_get, self.fail_put = 0, fail_get, fail_put
+
+    def _take(self):
+        if self.fail_get:
+            raise RuntimeError("pool exhausted")
+        self.out += 1
+        return object()
+
+    def _give(self, conn):
+        if self.fail_put:
+            raise RuntimeError("connection broken")
+        self.out -= 1
+
+    acquire = getconn = _take
+    release = putconn = _give
+
+
+def test_borrow_connections_returns_both():
+    ora_pool, pg_pool = FakePool(), FakePool()
+    with borrow_connections(ora_pool, pg_pool) as (ora, pg):
+        assert ora_pool.out == pg_pool.out == 1
+    assert ora_pool.out == pg_pool.out == 0
+
+
+def test_borrow_connections_releases_oracle_when_getconn_fails():
+    ora_pool = FakePool()
+    with pytest.raises(RuntimeError, match="pool exhausted"):
+        with borrow_connections(ora_pool, FakePool(fail_get=True)):
+            pass
+    assert ora_pool.out == 0
+
+
+def test_borrow_connections_releases_oracle_when_putconn_fails(capsys):
+    ora_pool = FakePool()
+    with pytest.raises(ValueError):
+        with borrow_connections(ora_pool, FakePool(fail_put=True), "[APP.T]"):
+            raise ValueError("body failed")
+    assert ora_pool.out == 0
+    assert "[APP.T] [WARN] Returning Postgres connection failed" in capsys.readouterr().out
+
+
+class FakePgConn:
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_pg_counts_batches_and_recounts_only_the_failing_batch(monkeypatch):
+    queries = []
+
+    def fake_pg_query_df(conn, sql, params=None, stream=False):
+        queries.append(sql)
+        if '"gone"' in sql:
+            raise RuntimeError('relation "app.gone" does not exist')
+        if params:
+            return pd.DataFrame([(name, 7) for name in params], columns=["name", "cnt"])
+        return pd.DataFrame([(7,)], columns=["count"])
+
+    monkeypatch.setattr(recon_lib, "pg_query_df", fake_pg_query_df)
+    monkeypatch.setattr(recon_lib, "COUNT_BATCH_SIZE", 2)
+    conn = FakePgConn()
+    counts, errors = pg_counts(conn, [("app", "a"), ("app", "b"), ("app", "c"), ("app", "gone"), ("app", "e")])
+    assert counts == {"app.a": 7, "app.b": 7, "app.c": 7, "app.e": 7}
+    assert set(errors) == {"app.gone"}
+    # three batched queries, then single-table recounts for the failing batch only
+    batched = [q for q in queries if "AS name" in q]
+    assert len(batched) == 3 and len(queries) - len(batched) == 2
+    assert conn.rollbacks == 2
+
+
+def test_pg_counts_empty():
+    assert pg_counts(FakePgConn(), []) == ({}, {})
+
+
+def test_pg_ensure_cat_function_passes_whole_row():
+    cols = [("id", "integer"), ("t", "text")]
+    name = pg_cat_function_name("app", "orders")
+    existing = {name: f"SELECT {pg_build_cat_expr(cols, 'app', 'orders', qualifier='r.')}"}
+    # body unchanged, so no DDL is issued and conn is never touched
+    call = pg_ensure_cat_function(None, "app", "orders", cols, existing)
+    assert call == f'recon."{name}"(t.*)'